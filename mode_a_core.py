@@ -0,0 +1,427 @@
+"""
+mode_a_core.py
+- Shared by mode_a_bot.py, mode_a_bot_v2.py and mode_a_bot_web.py
+- Config loading, text normalization, filters, listing parsers, sync fetchers
+- The entrypoints only wire Telegram and their own main loop
+"""
+
+import os, time, re, html, unicodedata, hashlib, logging, sqlite3
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import ahocorasick
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+import lxml.html
+from lxml import etree
+
+# ---------------- Setup ----------------
+HEADERS = {"User-Agent":"Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"}
+
+SEEN_TTL_SECONDS = 30 * 24 * 3600
+
+# Shared keep-alive session: reuses TCP/TLS connections to the same hosts across polls
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+# Validators from the last 200 per listing URL, sent back so unchanged pages answer 304
+LAST = {}
+
+_PRICE_RE = re.compile(r"(\d[\d\s]{0,6})\s*€")
+_WS_RE = re.compile(r"\s+")
+
+# Precompiled XPaths for the listing parsers (evaluated in C, no per-tag Python callbacks)
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+_XP_LBC_LINKS = etree.XPath("//a[contains(@href,'/vi/')]")
+_XP_VINTED_LINKS = etree.XPath("//a[contains(@href,'/items/')]")
+_XP_PRICE_NEXT = etree.XPath("string((descendant::*[self::span or self::div][contains(.,'€')]"
+                             " | following::*[self::span or self::div][contains(.,'€')])[1])")
+_XP_PRICE_IN = etree.XPath("string((descendant::*[self::span or self::div][contains(.,'€')])[1])")
+_XP_TEXT = etree.XPath("descendant::text()")
+_XP_IMG_SRC = etree.XPath("string((.//img)[1]/@src)")
+_XP_IMG_DATA_SRC = etree.XPath("string((.//img)[1]/@data-src)")
+_XP_DESC_TEXT = etree.XPath("(descendant::p | following::p)[1]/descendant::text()")
+
+# Coarse regex scan of the raw listing HTML (no DOM build); the lxml parse is the fallback
+# (href in double quotes, href in single quotes, card body): cards with either quote style are kept
+_LBC_CARD_RE = re.compile(r"""<a\s[^>]*href=(?:"([^"]*/vi/[^"]*)"|'([^']*/vi/[^']*)')[^>]*>(.*?)</a>""",
+                          re.DOTALL | re.IGNORECASE)
+_VINTED_CARD_RE = re.compile(r"""<a\s[^>]*href=(?:"([^"]*/items/[^"]*)"|'([^']*/items/[^']*)')[^>]*>(.*?)</a>""",
+                             re.DOTALL | re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPAN_DIV_CLOSE_RE = re.compile(r"</(?:span|div)\s*>", re.IGNORECASE)
+_IMG_TAG_RE = re.compile(r"<img\s[^>]*>", re.IGNORECASE)
+_SRC_RE = re.compile(r'(?<![\w-])src="([^"]*)"')
+_DATA_SRC_RE = re.compile(r'data-src="([^"]*)"')
+_P_RE = re.compile(r"<p(?:\s[^>]*)?>(.*?)</p>", re.DOTALL | re.IGNORECASE)
+# Bytes twins of the card patterns, to count cards while the body is still streaming
+LBC_CARD_BRE = re.compile(_LBC_CARD_RE.pattern.encode(), re.DOTALL | re.IGNORECASE)
+VINTED_CARD_BRE = re.compile(_VINTED_CARD_RE.pattern.encode(), re.DOTALL | re.IGNORECASE)
+_A_OPEN_BRE = re.compile(rb"<a\s", re.IGNORECASE)
+_A_CLOSE_BRE = re.compile(rb"</a>", re.IGNORECASE)
+# Newest cards worth reading per listing page; the rest of the HTML is not downloaded
+LISTING_LIMIT = 30
+
+CONFIG_PATH = "mode_a_config.json"
+
+# ---------------- Utils ----------------
+_CFG_MTIME = 0
+_CFG = None
+
+def load_cfg():
+    # Re-parse the config only when the file changed since the last poll
+    global _CFG, _CFG_MTIME
+    mtime = os.stat(CONFIG_PATH).st_mtime
+    if _CFG is None or mtime != _CFG_MTIME:
+        with open(CONFIG_PATH, "rb") as f:
+            _CFG = orjson.loads(f.read())
+        _CFG_MTIME = mtime
+        LAST.clear()  # new filters: re-read every listing page once instead of trusting 304s
+    return _CFG
+
+@lru_cache(maxsize=4096)
+def normalize(txt: str) -> str:
+    if not txt: return ""
+    if not txt.isascii():  # most titles are plain ASCII: skip the NFKD fold for them
+        txt = unicodedata.normalize("NFKD", txt).encode("ascii","ignore").decode("ascii")
+    return _WS_RE.sub(" ", txt.strip().lower())
+
+def parse_price(text: str):
+    if not text: return None
+    text = text.replace("\xa0"," ")
+    m = _PRICE_RE.search(text)
+    if m:
+        try: return int(m.group(1).replace(" ", ""))
+        except: return None
+    return None
+
+def join_text(texts) -> str:
+    # strip the text nodes returned by an XPath and join them with single spaces
+    return " ".join(s.strip() for s in texts if s.strip())
+
+def html_text(fragment: str) -> str:
+    return _WS_RE.sub(" ", html.unescape(_TAG_RE.sub(" ", fragment))).strip()
+
+def html_price(fragment: str):
+    # price from the first text node carrying "€", so digits in the title never merge into it;
+    # a bare "€" node also reads the text before it inside the same span/div ("80 <small>€</small>"),
+    # as the DOM's string() does. None when no such node has one, like the DOM parse
+    pieces = _TAG_RE.split(fragment)
+    tags = _TAG_RE.findall(fragment)  # tags[i] sits between pieces[i] and pieces[i + 1]
+    for i, piece in enumerate(pieces):
+        piece = html.unescape(piece)
+        if "€" not in piece:
+            continue
+        price = parse_price(piece)
+        while price is None and i and not _SPAN_DIV_CLOSE_RE.match(tags[i - 1]):
+            i -= 1
+            piece = html.unescape(pieces[i]) + piece
+            price = parse_price(piece)
+        if price is not None:
+            return price
+    return None
+
+def html_img(fragment: str):
+    m = _IMG_TAG_RE.search(fragment)
+    if not m:
+        return None
+    # first non-empty of src / data-src, like get("src") or get("data-src")
+    for attr_re in (_SRC_RE, _DATA_SRC_RE):
+        src = attr_re.search(m.group(0))
+        if src and src.group(1):
+            return html.unescape(src.group(1))
+    return None
+
+def fingerprint(url: str) -> bytes:
+    # 8-byte blake2b digest: only used as a dedup key, so no need for sha1 hex
+    return hashlib.blake2b(url.encode(), digest_size=8).digest()
+
+def _automaton(terms):
+    # Aho-Corasick: all terms matched in a single O(len(text)) pass; None for an empty list
+    A = ahocorasick.Automaton()
+    for term in terms:
+        term = normalize(term)
+        if term:
+            A.add_word(term, term)
+    if not len(A):
+        return None
+    A.make_automaton()
+    return A
+
+def _ac_hit(A, t: str) -> bool:
+    return A is not None and next(A.iter(t), None) is not None
+
+# Normalized view of the config term lists, built once per poll (not per item)
+def prepare_cfg(cfg) -> dict:
+    return {
+        "models_n": tuple(normalize(m) for m in cfg.get("models", [])),
+        "require_shipping": cfg.get("require_shipping", False),
+        "pos_n": tuple(normalize(w) for w in cfg.get("shipping_positive", [])),
+        "neg_n": tuple(normalize(w) for w in cfg.get("shipping_negative", [])),
+        "inc_group_acs": [_automaton(group) for group in cfg.get("terms_any", [])],
+        "exc_ac": _automaton(cfg.get("terms_exclude", [])),
+    }
+
+class SeenStore:
+    """Fingerprints already notified, persisted in sqlite so restarts don't re-notify."""
+    def __init__(self, path=None, ttl=SEEN_TTL_SECONDS):
+        # path read at open time so a .env loaded by the entrypoint still applies
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path or os.getenv("SEEN_DB_PATH", "seen.db"), isolation_level=None)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen(fid BLOB PRIMARY KEY, ts INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS seen_ts ON seen(ts)")
+
+    def __contains__(self, fid) -> bool:
+        return self.conn.execute("SELECT 1 FROM seen WHERE fid=?", (fid,)).fetchone() is not None
+
+    def add(self, fid):
+        self.conn.execute("INSERT OR IGNORE INTO seen(fid, ts) VALUES (?, ?)", (fid, int(time.time())))
+
+    def prune(self):
+        self.conn.execute("DELETE FROM seen WHERE ts < ?", (int(time.time()) - self.ttl,))
+
+def normalize_once(title: str, desc: str):
+    # (normalized title, normalized "title desc"): the only normalize calls per item
+    title_n = normalize(title or "")
+    desc_n = normalize(desc or "")
+    return title_n, f"{title_n} {desc_n}" if desc_n else title_n
+
+def in_model_range_n(title_n: str, models_n) -> bool:
+    if not models_n: return True
+    return any(map(title_n.__contains__, models_n))
+
+def price_ok(price, cfg) -> bool:
+    if price is None: return True
+    try:
+        p = float(price)
+        return cfg.get("price_min", 0) <= p <= cfg.get("price_max", 10**9)
+    except:
+        return True
+
+def shipping_passes_n(t: str, pcfg) -> bool:
+    if not pcfg["require_shipping"]:
+        return True
+    has_pos = any(map(t.__contains__, pcfg["pos_n"])) if pcfg["pos_n"] else True
+    has_neg = any(map(t.__contains__, pcfg["neg_n"]))
+    return has_pos and not has_neg
+
+def terms_pass_n(t: str, pcfg) -> bool:
+    inc_acs = pcfg["inc_group_acs"]
+    ok_any = True
+    if inc_acs:
+        ok_any = any(_ac_hit(A, t) for A in inc_acs)
+    ok_exc = not _ac_hit(pcfg["exc_ac"], t)
+    return ok_any and ok_exc
+
+# ---------------- Notifications ----------------
+def format_item(item, tag=None) -> str:
+    prefix = f"{tag} " if tag else ""
+    lines = [
+        f"{prefix}{'📱' if 'iphone' in normalize(item.get('title','')) else '📟'} {item.get('title','(Sans titre)')}",
+        f"💶 {item.get('price','?')}",
+        f"🔗 {item.get('url')}"
+    ]
+    return "\n".join(lines)
+
+def batch_messages(messages, limit=4000):
+    # Pack text notifications into as few blocks as fit Telegram's 4096-char cap
+    block = ""
+    for msg in messages:
+        if block and len(block) + 2 + len(msg) > limit:
+            yield block
+            block = ""
+        block = f"{block}\n\n{msg}" if block else msg
+    if block:
+        yield block
+
+# ---------------- Parsers ----------------
+def scan_leboncoin(text):
+    items = []
+    cards = list(_LBC_CARD_RE.finditer(text))
+    for i, m in enumerate(cards):
+        href = html.unescape(m.group(1) or m.group(2))
+        link = "https://www.leboncoin.fr" + href if href.startswith("/") else href
+        # the price is the first "… €" between this card and the next one
+        end = cards[i + 1].start() if i + 1 < len(cards) else len(text)
+        price = html_price(text[m.start():end])
+        desc = ""
+        sib = _P_RE.search(text, m.start())
+        if sib:
+            desc = html_text(sib.group(1))
+        items.append({"title": html_text(m.group(3)), "price": price, "url": link, "photo": html_img(m.group(3)), "desc": desc, "platform": "leboncoin"})
+    return items
+
+def parse_leboncoin(content):
+    tree = lxml.html.fromstring(content, parser=_HTML_PARSER)
+    items = []
+    for a in _XP_LBC_LINKS(tree):
+        href = a.get("href") or ""
+        if not href:
+            continue
+        link = "https://www.leboncoin.fr" + href if href.startswith("/") else href
+        title = join_text(_XP_TEXT(a))
+        price = parse_price(_XP_PRICE_NEXT(a))
+        img = _XP_IMG_SRC(a) or _XP_IMG_DATA_SRC(a) or None
+        desc = join_text(_XP_DESC_TEXT(a))
+        items.append({"title": title, "price": price, "url": link, "photo": img, "desc": desc, "platform": "leboncoin"})
+    return items
+
+def scan_vinted(text):
+    items = []
+    for m in _VINTED_CARD_RE.finditer(text):
+        href = html.unescape(m.group(1) or m.group(2))
+        link = "https://www.vinted.fr" + href if href.startswith("/") else href
+        title = html_text(m.group(3))
+        items.append({"title": title, "price": html_price(m.group(3)), "url": link, "photo": html_img(m.group(3)), "desc": "", "platform": "vinted"})
+    return items
+
+def parse_vinted(content):
+    tree = lxml.html.fromstring(content, parser=_HTML_PARSER)
+    items = []
+    for a in _XP_VINTED_LINKS(tree):
+        href = a.get("href") or ""
+        if not href:
+            continue
+        link = "https://www.vinted.fr" + href if href.startswith("/") else href
+        title = join_text(_XP_TEXT(a))
+        price = parse_price(_XP_PRICE_IN(a))
+        img = _XP_IMG_SRC(a) or _XP_IMG_DATA_SRC(a) or None
+        desc = ""
+        items.append({"title": title, "price": price, "url": link, "photo": img, "desc": desc, "platform": "vinted"})
+    return items
+
+class ListingBuffer:
+    """Streamed listing page body, counting cards as chunks arrive."""
+    def __init__(self, card_re):
+        self.card_re = card_re
+        self.buf = bytearray()
+        self.pos = self.found = 0
+
+    def feed(self, chunk) -> bool:
+        # True once LISTING_LIMIT cards (+1, which bounds the last one) have arrived
+        start = max(len(self.buf) - 3, self.pos)
+        self.buf += chunk
+        # A new card can only end on a "</a>" that just arrived; after it, only an "<a" that
+        # is still open can start the next one, so just that unfinished tail is rescanned
+        close = None
+        for close in _A_CLOSE_BRE.finditer(self.buf, start):
+            pass
+        if close is not None:
+            for m in self.card_re.finditer(self.buf, self.pos):
+                self.found += 1
+                self.pos = m.end()
+            self.pos = max(self.pos, close.end())
+        opening = _A_OPEN_BRE.search(self.buf, self.pos)
+        self.pos = opening.start() if opening else max(self.pos, len(self.buf) - 2)
+        return self.found > LISTING_LIMIT
+
+def read_listing(chunks, card_re):
+    listing = ListingBuffer(card_re)
+    for chunk in chunks:
+        if listing.feed(chunk):
+            break
+    return bytes(listing.buf)
+
+def conditional_headers(url) -> dict:
+    last = LAST.get(url, {})
+    headers = {}
+    if last.get("etag"):
+        headers["If-None-Match"] = last["etag"]
+    if last.get("lm"):
+        headers["If-Modified-Since"] = last["lm"]
+    return headers
+
+def remember_validators(url, headers):
+    LAST[url] = {"etag": headers.get("ETag", ""), "lm": headers.get("Last-Modified", "")}
+
+def leboncoin_items(content):
+    items = scan_leboncoin(content.decode("utf-8", "replace"))
+    if not items:  # no regex hit: layout changed, fall back to the DOM parse
+        items = parse_leboncoin(content)
+    return items[:LISTING_LIMIT]
+
+def vinted_items(content):
+    items = scan_vinted(content.decode("utf-8", "replace"))
+    if not items:  # no regex hit: layout changed, fall back to the DOM parse
+        items = parse_vinted(content)
+    return items[:LISTING_LIMIT]
+
+def conditional_get(url, card_re):
+    # Returns (possibly truncated body, response headers), or None when unchanged since the
+    # last poll (304). Validators are stored by the caller once the body has been parsed.
+    with SESSION.get(url, headers=conditional_headers(url), timeout=20, stream=True) as r:
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        return read_listing(r.iter_content(8192), card_re), r.headers
+
+def fetch_leboncoin(url):
+    page = conditional_get(url, LBC_CARD_BRE)
+    if page is None:
+        return []
+    items = leboncoin_items(page[0])
+    remember_validators(url, page[1])
+    return items
+
+def fetch_vinted(url):
+    page = conditional_get(url, VINTED_CARD_BRE)
+    if page is None:
+        return []
+    items = vinted_items(page[0])
+    remember_validators(url, page[1])
+    return items
+
+# ---------------- Core loop ----------------
+def source_jobs(cfg, lbc_fetch, vinted_fetch):
+    # (label, fetcher, url) for every enabled platform that has base_urls
+    platforms = cfg.get("platforms", ["leboncoin", "vinted"])
+    jobs = []
+    if "leboncoin" in platforms and "base_urls" in cfg.get("leboncoin", {}):
+        jobs += [("LBC", lbc_fetch, u) for u in cfg["leboncoin"]["base_urls"]]
+    if "vinted" in platforms and "base_urls" in cfg.get("vinted", {}):
+        jobs += [("Vinted", vinted_fetch, u) for u in cfg["vinted"]["base_urls"]]
+    return jobs
+
+def fetch_all(jobs):
+    # Fetch all (label, fetcher, url) jobs concurrently: poll latency is max, not sum
+    results = []
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        futs = {ex.submit(fn, u): label for label, fn, u in jobs}
+        for f in as_completed(futs):
+            try:
+                results += f.result()
+            except Exception as e:
+                logging.warning(f"{futs[f]} fetch fail: {e}")
+    return results
+
+def select_new(cfg, seen, results):
+    # Filter scraped items; returns the ones to notify and marks them as seen
+    pcfg = prepare_cfg(cfg)
+    # the same listing can come back from several base_urls: filter each URL once
+    results = list({it["url"]: it for it in results}.values())
+    new = []
+    for it in results:
+        fid = fingerprint(it["url"])
+        if fid in seen:
+            continue
+        title = it.get("title","")
+        desc  = it.get("desc","")
+        price = it.get("price")
+
+        # cheapest checks first; text is normalized once and reused below
+        if not price_ok(price, cfg):
+            continue
+        title_n, t = normalize_once(title, desc)
+        if not in_model_range_n(title_n, pcfg["models_n"]):
+            continue
+        if not terms_pass_n(t, pcfg):
+            continue
+        if not shipping_passes_n(t, pcfg):
+            continue
+
+        new.append(it)
+        seen.add(fid)
+    return new
+
+def run_once(cfg, seen):
+    return select_new(cfg, seen, fetch_all(source_jobs(cfg, fetch_leboncoin, fetch_vinted)))
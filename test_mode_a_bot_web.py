@@ -0,0 +1,35 @@
+import asyncio
+import os
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test")
+os.environ.setdefault("TELEGRAM_CHAT_ID", "1")
+
+import mode_a_bot_web as web_bot
+from mode_a_core import SeenStore
+
+
+def test_stop_bot_cancels_during_error_report(monkeypatch):
+    reporting = asyncio.Event()
+
+    async def slow_send(http, text):
+        if text.startswith("⚠️"):
+            reporting.set()
+            await asyncio.sleep(3600)
+
+    def broken_cfg():
+        raise RuntimeError("bad config")
+
+    monkeypatch.setattr(web_bot, "tg_send_message", slow_send)
+    monkeypatch.setattr(web_bot, "load_cfg", broken_cfg)
+    monkeypatch.setattr(web_bot, "SeenStore", lambda: SeenStore(":memory:"))
+
+    async def scenario():
+        app = {"bot_task": asyncio.create_task(web_bot.run_bot(None))}
+        await asyncio.wait_for(reporting.wait(), 1)
+        # asyncio.wait, not wait_for: a timeout must not cancel the task a second time
+        stopping = asyncio.create_task(web_bot.stop_bot(app))
+        done, _ = await asyncio.wait({stopping}, timeout=1)
+        assert stopping in done
+        assert app["bot_task"].cancelled()
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+import pytest
+
+import mode_a_core as core
+
+
+def _vinted_page(card):
+    return f'<html><body><a href="/items/1-x">{card}</a></body></html>'
+
+
+def _lbc_page(card):
+    return f'<html><body><a href="/vi/1.htm">{card}</a></body></html>'
+
+
+def test_scan_and_dom_price_agree():
+    cards = {
+        "<span>iPhone 13</span> <span>150 €</span>": 150,
+        "<span>iPhone 13</span> <span>150&nbsp;&euro;</span>": 150,
+        "<span>iPhone 13</span><span>150</span><span>€</span>": None,
+        "<span>iPhone 13</span><span>150</span><span>&euro;</span>": None,
+        "<span>iPhone 13</span> <span>80 <small>€</small></span>": 80,
+        "<span>iPhone 13</span> <span><b>80</b>&nbsp;<small>&euro;</small></span>": 80,
+        "<span>iPhone 13</span>": None,
+    }
+    for card, price in cards.items():
+        page = _vinted_page(card)
+        assert core.scan_vinted(page)[0]["price"] == price, card
+        assert core.parse_vinted(page.encode())[0]["price"] == price, card
+        page = _lbc_page(card)
+        assert core.scan_leboncoin(page)[0]["price"] == price, card
+        assert core.parse_leboncoin(page.encode())[0]["price"] == price, card
+
+
+def test_scan_and_dom_image_agree():
+    imgs = {
+        '<img src="http://img/1.jpg">': "http://img/1.jpg",
+        '<img src="" data-src="http://img/1.jpg">': "http://img/1.jpg",
+        '<img data-src="http://img/1.jpg" src="http://img/2.jpg">': "http://img/2.jpg",
+        "<span>no image</span>": None,
+    }
+    for card, photo in imgs.items():
+        page = _vinted_page(card)
+        assert core.scan_vinted(page)[0]["photo"] == photo, card
+        assert core.parse_vinted(page.encode())[0]["photo"] == photo, card
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, body, headers):
+        self.body, self.headers = body, headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        yield self.body
+
+
+def test_validators_stored_only_after_parse(monkeypatch):
+    url = "https://www.vinted.fr/catalog"
+    core.LAST.pop(url, None)
+    monkeypatch.setattr(core.SESSION, "get", lambda *a, **k: _Response(b"  ", {"ETag": '"v1"'}))
+    with pytest.raises(Exception):
+        core.fetch_vinted(url)
+    assert url not in core.LAST
+
+    page = _vinted_page("<span>iPhone 13</span> <span>150 €</span>").encode()
+    monkeypatch.setattr(core.SESSION, "get", lambda *a, **k: _Response(page, {"ETag": '"v1"'}))
+    assert len(core.fetch_vinted(url)) == 1
+    assert core.conditional_headers(url) == {"If-None-Match": '"v1"'}
+    core.LAST.pop(url, None)
+
+
+def test_listing_buffer_counts_cards_across_chunks():
+    page = b"".join(
+        b'<div><a class="nav">x</a><a href="/items/%d-x"><span>t</span></a>' % i for i in range(40)
+    )
+    for step in (1, 3, 7, 64, 8192):
+        listing = core.ListingBuffer(core.VINTED_CARD_BRE)
+        for i in range(0, len(page), step):
+            listing.feed(page[i:i + step])
+        assert listing.found == len(core.VINTED_CARD_BRE.findall(page)), step
+
+
+def test_scan_keeps_single_quoted_cards():
+    page = (
+        '<html><body><a href="/vi/1.htm"><span>iPhone 13</span></a>'
+        "<a href='/vi/2.htm'><span>iPhone 14</span></a>"
+        "<a class='c' href='/items/3-x?o=it&#39;s'><span>iPhone 15</span></a></body></html>"
+    )
+    for scan, parse in ((core.scan_leboncoin, core.parse_leboncoin), (core.scan_vinted, core.parse_vinted)):
+        assert [it["url"] for it in scan(page)] == [it["url"] for it in parse(page.encode())]
+    assert len(core.scan_leboncoin(page)) == 2
+    assert len(core.VINTED_CARD_BRE.findall(page.encode())) == 1